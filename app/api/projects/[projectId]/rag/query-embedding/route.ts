@@ -31,7 +31,8 @@ export async function POST(
     }
 
     // Parse request body
-    const { query } = await request.json()
+    // dimensions is optional - pass it to search chunks stored with embedding_dimensions
+    const { query, dimensions } = await request.json()
     
     if (!query || typeof query !== 'string' || query.trim().length === 0) {
       return NextResponse.json({ error: "Query is required" }, { status: 400 })
@@ -50,15 +51,38 @@ export async function POST(
       input: query.trim(),
     })
 
-    const embedding = response.data[0].embedding
+    let embedding = response.data[0].embedding
+    let projection = null
     console.log(`Generated ${embedding.length}-dimensional embedding for query`)
 
+    // Reduced chunk embeddings can only be compared with queries reduced by the
+    // same projection, which lives in the PDF service
+    if (dimensions) {
+      const pythonServiceUrl = process.env.PYTHON_PDF_SERVICE_URL || 'http://localhost:8000'
+      const projectionResponse = await fetch(`${pythonServiceUrl}/project-embedding`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ embedding, dimensions }),
+      })
+
+      if (!projectionResponse.ok) {
+        const errorText = await projectionResponse.text()
+        return NextResponse.json({ error: `Failed to project query embedding: ${errorText}` }, { status: projectionResponse.status })
+      }
+
+      const projected = await projectionResponse.json()
+      embedding = projected.embedding
+      projection = projected.projection
+      console.log(`Projected query embedding to ${embedding.length} dimensions (${projection.id})`)
+    }
+
     return NextResponse.json({
       success: true,
       query: query.trim(),
       embedding: embedding,
       embeddingDimensions: embedding.length,
-      model: "text-embedding-ada-002"
+      model: "text-embedding-ada-002",
+      projection: projection
     })
 
   } catch (error: any) {
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI embeddings API, used by the load-test harness.
+
+Serves POST /v1/embeddings with deterministic fake embeddings, configurable
+latency and injected 429 responses (with retry-after-ms and x-ratelimit-*
+headers), so the PDF service can be load tested without real API calls.
+
+Point the service at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+from typing import List, Union
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+class Settings:
+    latency_ms = 50.0
+    jitter_ms = 20.0
+    rate_429 = 0.0
+    retry_after_ms = 200
+    rpm_limit = 3000
+    tpm_limit = 1000000
+
+
+settings = Settings()
+stats = {"requests": 0, "rate_limited": 0}
+
+app = FastAPI(title="Fake OpenAI Embeddings", version="1.0.0")
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+
+
+def fake_embedding(text: str) -> List[float]:
+    """Deterministic pseudo-random embedding, so identical text embeds identically"""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-0.05, 0.05) for _ in range(EMBEDDING_DIMENSIONS)]
+
+
+def rate_limit_headers(remaining_requests: int) -> dict:
+    return {
+        "x-ratelimit-limit-requests": str(settings.rpm_limit),
+        "x-ratelimit-remaining-requests": str(remaining_requests),
+        "x-ratelimit-limit-tokens": str(settings.tpm_limit),
+        "x-ratelimit-remaining-tokens": str(settings.tpm_limit),
+        "x-ratelimit-reset-requests": "20ms",
+        "x-ratelimit-reset-tokens": "0s",
+    }
+
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: EmbeddingRequest):
+    stats["requests"] += 1
+    delay = max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms))
+    await asyncio.sleep(delay / 1000.0)
+
+    if random.random() < settings.rate_429:
+        stats["rate_limited"] += 1
+        headers = rate_limit_headers(0)
+        headers["retry-after-ms"] = str(settings.retry_after_ms)
+        return JSONResponse(
+            status_code=429,
+            headers=headers,
+            content={"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+        )
+
+    inputs = [request.input] if isinstance(request.input, str) else request.input
+    tokens = sum(len(text) // 4 + 1 for text in inputs)
+    return JSONResponse(
+        headers=rate_limit_headers(settings.rpm_limit - 1),
+        content={
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            "model": request.model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        },
+    )
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=settings.jitter_ms, help="Uniform +/- jitter on latency")
+    parser.add_argument("--rate-429", type=float, default=settings.rate_429, help="Fraction of requests answered with 429 (0-1)")
+    parser.add_argument("--retry-after-ms", type=int, default=settings.retry_after_ms, help="retry-after-ms sent with injected 429s")
+    args = parser.parse_args()
+
+    settings.latency_ms = args.latency_ms
+    settings.jitter_ms = args.jitter_ms
+    settings.rate_429 = args.rate_429
+    settings.retry_after_ms = args.retry_after_ms
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
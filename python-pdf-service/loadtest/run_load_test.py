@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the PDF service.
+
+Replays a mixed corpus of PDFs against /extract-text, /extract-for-cag and
+/chunk-text at one or more concurrency levels and reports throughput,
+p50/p95/p99 latency and the service's peak RSS for each level.
+
+By default it starts its own copy of the service (uvicorn main:app) wired to
+the local fake OpenAI server in fake_openai.py, so no real API calls are made.
+Pass --service-url to test an already running instance instead (peak RSS is
+then only reported if --service-pid is given and the process is local).
+
+Example:
+    python loadtest/run_load_test.py --concurrency 1,4,16 --requests 100 --rate-429 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+LOADTEST_DIR = Path(__file__).resolve().parent
+SERVICE_DIR = LOADTEST_DIR.parent
+
+ENDPOINTS = ("extract-text", "extract-for-cag", "chunk-text")
+DEFAULT_MIX = "extract-text=2,extract-for-cag=2,chunk-text=1"
+# (name, pages, lines per page) for the generated corpus
+SYNTHETIC_CORPUS = [("small", 1, 30), ("medium", 10, 45), ("large", 40, 50)]
+
+WORDS = (
+    "customer research interview persona insight brand product market survey "
+    "respondent analysis theme quote behaviour motivation pricing channel segment "
+    "journey experience feedback adoption retention churn value proposition"
+).split()
+
+
+# Corpus
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_text_pdf(pages: List[List[str]]) -> bytes:
+    """Build a minimal PDF with one Helvetica text line per entry on each page"""
+    page_count = len(pages)
+    font_id = 3 + 2 * page_count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)), page_count),
+    ]
+    for i, lines in enumerate(pages):
+        content = "BT /F1 9 Tf 36 806 Td 14 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return output.encode("latin-1")
+
+
+def synthetic_corpus(seed: int = 7) -> List[Tuple[str, bytes]]:
+    rng = random.Random(seed)
+    corpus = []
+    for name, page_count, lines_per_page in SYNTHETIC_CORPUS:
+        pages = [
+            [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "." for _ in range(lines_per_page)]
+            for _ in range(page_count)
+        ]
+        corpus.append((f"{name}.pdf", build_text_pdf(pages)))
+    return corpus
+
+
+def load_corpus(corpus_dir: Optional[str]) -> List[Tuple[str, bytes]]:
+    if not corpus_dir:
+        return synthetic_corpus()
+    files = sorted(Path(corpus_dir).glob("*.pdf"))
+    if not files:
+        raise SystemExit(f"No .pdf files found in {corpus_dir}")
+    return [(path.name, path.read_bytes()) for path in files]
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        endpoint, _, weight = part.strip().partition("=")
+        if endpoint not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {endpoint} (expected one of {', '.join(ENDPOINTS)})")
+        weights[endpoint] = int(weight or 1)
+    return weights
+
+
+# Processes
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+def start_fake_openai(args) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, str(LOADTEST_DIR / "fake_openai.py"),
+            "--port", str(port),
+            "--latency-ms", str(args.latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--rate-429", str(args.rate_429),
+        ],
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_for_http(f"{base_url}/stats")
+    return process, f"{base_url}/v1"
+
+
+def start_service(openai_base_url: str, show_logs: bool) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ, OPENAI_BASE_URL=openai_base_url, OPENAI_API_KEY="sk-loadtest")
+    output = None if show_logs else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, env=env, stdout=output, stderr=output,
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_for_http(f"{url}/health", timeout=60.0)
+    return process, url
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """Current resident set size of a local process (Linux /proc only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+# Load generation
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+async def sample_peak_rss(pid: Optional[int], stop: asyncio.Event, interval: float = 0.1) -> Optional[int]:
+    if pid is None:
+        return None
+    peak = read_rss_bytes(pid)
+    while not stop.is_set():
+        rss = read_rss_bytes(pid)
+        if rss is not None and (peak is None or rss > peak):
+            peak = rss
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+    return peak
+
+
+async def run_level(
+    service_url: str,
+    corpus: List[Tuple[str, bytes]],
+    weights: Dict[str, int],
+    concurrency: int,
+    total_requests: int,
+    service_pid: Optional[int],
+    timeout: float,
+    seed: int,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    endpoints = list(weights)
+    jobs: asyncio.Queue = asyncio.Queue()
+    for _ in range(total_requests):
+        endpoint = rng.choices(endpoints, weights=[weights[e] for e in endpoints])[0]
+        jobs.put_nowait((endpoint, rng.choice(corpus)))
+
+    results = []
+    dropped_chunks = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal dropped_chunks
+        while True:
+            try:
+                endpoint, (filename, content) = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{service_url}/{endpoint}",
+                    files={"file": (filename, content, "application/pdf")},
+                )
+                status = response.status_code
+                if endpoint == "chunk-text" and status == 200:
+                    dropped_chunks += len(response.json().get("dropped_chunks", []))
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results.append((endpoint, status, time.perf_counter() - started))
+
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_peak_rss(service_pid, stop_sampling))
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop_sampling.set()
+    peak_rss = await sampler
+
+    ok_latencies = [latency for _, status, latency in results if status == 200]
+    errors = defaultdict(int)
+    for _, status, _ in results:
+        if status != 200:
+            errors[str(status)] += 1
+
+    per_endpoint = {}
+    for endpoint in endpoints:
+        latencies = [latency for e, status, latency in results if e == endpoint and status == 200]
+        per_endpoint[endpoint] = {
+            "requests": sum(1 for e, _, _ in results if e == endpoint),
+            "ok": len(latencies),
+            **summarize(latencies),
+        }
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok_latencies),
+        "errors": dict(errors),
+        "dropped_chunks": dropped_chunks,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok_latencies) / elapsed, 2) if elapsed else 0.0,
+        **summarize(ok_latencies),
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss else None,
+        "endpoints": per_endpoint,
+    }
+
+
+def print_report(levels: List[Dict[str, Any]]) -> None:
+    header = f"{'conc':>5} {'reqs':>6} {'ok':>6} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        peak = f"{level['peak_rss_mb']:.1f}" if level["peak_rss_mb"] else "n/a"
+        print(
+            f"{level['concurrency']:>5} {level['requests']:>6} {level['ok']:>6} {sum(level['errors'].values()):>5} "
+            f"{level['throughput_rps']:>8.2f} {level['p50_ms']:>9.1f} {level['p95_ms']:>9.1f} {level['p99_ms']:>9.1f} {peak:>12}"
+        )
+    for level in levels:
+        print(f"\nconcurrency {level['concurrency']}:")
+        for endpoint, stats in level["endpoints"].items():
+            print(
+                f"  /{endpoint:<16} {stats['ok']:>4}/{stats['requests']:<4} ok  "
+                f"p50 {stats['p50_ms']:>8.1f}  p95 {stats['p95_ms']:>8.1f}  p99 {stats['p99_ms']:>8.1f} ms"
+            )
+        if level["errors"]:
+            print(f"  errors: {level['errors']}")
+        if level["dropped_chunks"]:
+            print(f"  dropped chunks: {level['dropped_chunks']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the PDF service")
+    parser.add_argument("--service-url", help="Test an already running service instead of starting one")
+    parser.add_argument("--service-pid", type=int, help="PID of --service-url's process, for peak RSS")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels to step through")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. extract-text=2,chunk-text=1")
+    parser.add_argument("--corpus", help="Directory of PDFs to replay (default: generated small/medium/large PDFs)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake OpenAI mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Fake OpenAI latency jitter")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of fake OpenAI calls answered with 429")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix")
+    parser.add_argument("--json", dest="json_path", help="Also write the results as JSON to this path")
+    parser.add_argument("--show-service-logs", action="store_true", help="Don't silence the service's output")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    weights = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    processes = []
+    try:
+        if args.service_url:
+            service_url, service_pid = args.service_url.rstrip("/"), args.service_pid
+        else:
+            fake_openai, openai_base_url = start_fake_openai(args)
+            processes.append(fake_openai)
+            service, service_url = start_service(openai_base_url, args.show_service_logs)
+            processes.append(service)
+            service_pid = service.pid
+
+        print(f"Service: {service_url}")
+        print(f"Corpus: {', '.join(f'{name} ({len(content) // 1024} KiB)' for name, content in corpus)}")
+        print(f"Mix: {weights}")
+
+        results = []
+        for concurrency in levels:
+            print(f"Running {args.requests} requests at concurrency {concurrency}...")
+            results.append(asyncio.run(run_level(
+                service_url, corpus, weights, concurrency, args.requests, service_pid, args.timeout, args.seed,
+            )))
+        print_report(results)
+
+        if args.json_path:
+            settings = {key: value for key, value in vars(args).items() if key != "json_path"}
+            Path(args.json_path).write_text(json.dumps({"settings": settings, "levels": results}, indent=2))
+            print(f"\nResults written to {args.json_path}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, Form, Header, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
+from functools import lru_cache
+from operator import itemgetter
 import PyPDF2
+import asyncio
 import io
+import json
+import math
 import os
+import random
+import struct
+import uuid
 from dotenv import load_dotenv
 import logging
 # from llama_index.node_parser import SentenceSplitter
 # from llama_index.schema import Document
 import openai
+from rate_limiter import embedding_scheduler
+from profiling import (
+    PROFILE_MODES,
+    ProfilerBusyError,
+    ProfilingMiddleware,
+    RequestProfile,
+    is_admin_token,
+    profile_store,
+    profiling_enabled,
+)
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +38,11 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Initialize OpenAI client - retries are handled by the shared embedding scheduler.
+# Embedding calls normally take well under a second, so a hung call times out
+# (and is retried) instead of holding a scheduler slot for the SDK's default 600s.
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, timeout=OPENAI_TIMEOUT_SECONDS)
 
 # Create FastAPI app
 app = FastAPI(title="PDF Text Extraction Service", version="1.0.0")
@@ -42,8 +65,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id"],
 )
 
+# Request profiling (admin only) - the middleware is only installed when
+# ADMIN_PROFILING_TOKEN is set, so it costs nothing when profiling is off
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
 # Response models
 class HealthResponse(BaseModel):
     status: str
@@ -61,7 +90,38 @@ class TextExtractionResponse(BaseModel):
 class ChunkResponse(BaseModel):
     text: str
     metadata: Dict[str, Any]
+    # int8 embeddings are returned as integers (multiply by embedding_scale)
+    embedding: List[Union[int, float]]
+    # Only set when a quantized embedding precision was requested
+    embedding_precision: Optional[str] = None
+    embedding_scale: Optional[float] = None
+
+class QuantizationReport(BaseModel):
+    precision: str
+    original_dimensions: int
+    dimensions: int
+    sample_size: int
+    top_k: int
+    recall_at_k: float
+    recall_loss: float
+    bytes_per_vector_full: int
+    bytes_per_vector_quantized: int
+    compression_ratio: float
+
+class ProjectEmbeddingRequest(BaseModel):
     embedding: List[float]
+    dimensions: int
+    embedding_precision: str = "float32"
+
+class ProjectEmbeddingResponse(BaseModel):
+    embedding: List[Union[int, float]]
+    embedding_precision: str
+    embedding_scale: Optional[float] = None
+    projection: Dict[str, Any]
+
+class DroppedChunk(BaseModel):
+    chunk_index: int
+    error: str
 
 class ChunkingResponse(BaseModel):
     success: bool
@@ -70,6 +130,8 @@ class ChunkingResponse(BaseModel):
     filename: str
     total_chunks: int
     avg_chunk_size: int
+    quantization_report: Optional[QuantizationReport] = None
+    dropped_chunks: List[DroppedChunk] = []
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -197,10 +259,13 @@ def create_text_chunks(text: str, filename: str) -> List[Dict[str, Any]]:
                 
                 chunk_index += 1
             
+            # Stop once the last chunk reaches the end of the text, otherwise the
+            # overlap would keep re-chunking the same tail forever
+            if end >= len(text):
+                break
+
             # Move start position with overlap
             start = end - chunk_overlap
-            if start >= len(text):
-                break
         
         print(f"✅ [CHUNKING] Created {len(chunks)} text chunks")
         if chunks:
@@ -214,51 +279,276 @@ def create_text_chunks(text: str, filename: str) -> List[Dict[str, Any]]:
         logger.error(f"Error creating text chunks: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create text chunks: {str(e)}")
 
-async def generate_embeddings_for_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Generate OpenAI embeddings for text chunks"""
+async def generate_embeddings_for_chunks(chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Generate OpenAI embeddings for text chunks
+
+    Requests go through the process-wide embedding scheduler, which handles rate
+    limits and retries. Returns (chunks_with_embeddings, dropped_chunks) where
+    dropped_chunks lists the chunks that still failed after retrying.
+    """
     try:
         print("🤖 [EMBEDDINGS] Starting embeddings generation...")
         logger.info(f"Generating embeddings for {len(chunks)} chunks")
         
-        chunks_with_embeddings = []
+        # Identifies this document to the scheduler so capacity is shared fairly
+        document_id = uuid.uuid4().hex
+        
+        async def embed_chunk(i: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+            embedding = await embedding_scheduler.create_embedding(openai_client, chunk["text"], document_id)
+            print(f"✅ [EMBEDDINGS] Chunk {i+1}/{len(chunks)}: {len(embedding)}-dimensional embedding generated")
+            return {
+                "text": chunk["text"],
+                "metadata": chunk["metadata"],
+                "embedding": embedding
+            }
+        
+        results = await asyncio.gather(
+            *(embed_chunk(i, chunk) for i, chunk in enumerate(chunks)),
+            return_exceptions=True
+        )
         
-        for i, chunk in enumerate(chunks):
-            try:
-                print(f"🧠 [EMBEDDINGS] Generating embedding for chunk {i+1}/{len(chunks)}...")
-                
-                # Generate embedding using OpenAI API
-                response = openai_client.embeddings.create(
-                    model="text-embedding-ada-002",
-                    input=chunk["text"]
-                )
-                
-                embedding = response.data[0].embedding
-                
-                # Add embedding to chunk
-                chunk_with_embedding = {
-                    "text": chunk["text"],
-                    "metadata": chunk["metadata"],
-                    "embedding": embedding
-                }
-                
-                chunks_with_embeddings.append(chunk_with_embedding)
-                
-                print(f"✅ [EMBEDDINGS] Chunk {i+1}: {len(embedding)}-dimensional embedding generated")
-                
-            except Exception as e:
-                print(f"❌ [EMBEDDINGS] Error generating embedding for chunk {i+1}: {e}")
-                logger.warning(f"Error generating embedding for chunk {i+1}: {e}")
-                # Continue with other chunks even if one fails
-                continue
+        chunks_with_embeddings = []
+        dropped_chunks = []
+        for i, (chunk, result) in enumerate(zip(chunks, results)):
+            if isinstance(result, BaseException):
+                print(f"❌ [EMBEDDINGS] Error generating embedding for chunk {i+1}: {result}")
+                logger.warning(f"Error generating embedding for chunk {i+1}: {result}")
+                dropped_chunks.append({
+                    "chunk_index": chunk["metadata"]["chunk_index"],
+                    "error": f"{type(result).__name__}: {result}"
+                })
+            else:
+                chunks_with_embeddings.append(result)
         
         print(f"🎉 [EMBEDDINGS] Successfully generated embeddings for {len(chunks_with_embeddings)} chunks")
-        return chunks_with_embeddings
+        if dropped_chunks:
+            print(f"⚠️  [EMBEDDINGS] Dropped {len(dropped_chunks)} chunks after retries")
+            logger.warning(f"Dropped {len(dropped_chunks)}/{len(chunks)} chunks after retries")
+        return chunks_with_embeddings, dropped_chunks
         
     except Exception as e:
         print(f"💥 [EMBEDDINGS] Error generating embeddings: {e}")
         logger.error(f"Error generating embeddings: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate embeddings: {str(e)}")
 
+# Embedding quantization - opt-in compact embeddings for /chunk-text
+EMBEDDING_PRECISIONS = ("float32", "float16", "int8")
+# Only these target sizes are accepted, which also bounds the projection cache
+EMBEDDING_DIMENSION_OPTIONS = (256, 512, 768, 1024)
+EMBEDDING_PROJECTION_SEED = 42
+QUANTIZATION_EVAL_SAMPLE_SIZE = 50
+QUANTIZATION_EVAL_TOP_K = 10
+
+def _make_gather(indices: List[int]):
+    """Callable returning the components at `indices` as a sequence"""
+    if len(indices) > 1:
+        return itemgetter(*indices)
+    # itemgetter needs an index and returns a bare value for just one
+    return lambda embedding: [embedding[i] for i in indices]
+
+@lru_cache(maxsize=len(EMBEDDING_DIMENSION_OPTIONS))
+def _get_projection(input_dimensions: int, output_dimensions: int, seed: int = EMBEDDING_PROJECTION_SEED) -> Tuple[List[tuple], float]:
+    """Build (and cache) a very sparse random projection matrix.
+
+    Each entry is +1 or -1 with probability 1/(2*sqrt(input_dimensions)) and 0
+    otherwise (Li, Hastie & Church, 2006), so each output component only sums
+    ~sqrt(input_dimensions) input components. Rows are stored as itemgetters
+    over the positive and negative indices so the gather runs in C.
+    Returns (rows, scale).
+    """
+    density = 1.0 / math.sqrt(input_dimensions)
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(output_dimensions):
+        positive, negative = [], []
+        for i in range(input_dimensions):
+            r = rng.random()
+            if r < density / 2:
+                positive.append(i)
+            elif r < density:
+                negative.append(i)
+        rows.append((_make_gather(positive), _make_gather(negative)))
+    return rows, math.sqrt(1.0 / (density * output_dimensions))
+
+def projection_info(input_dimensions: int, dimensions: int) -> Dict[str, Any]:
+    """Identifies the projection used, so stored vectors can be matched with query vectors"""
+    return {
+        "id": f"vsrp-{input_dimensions}x{dimensions}-seed{EMBEDDING_PROJECTION_SEED}",
+        "method": "very_sparse_random_projection",
+        "seed": EMBEDDING_PROJECTION_SEED,
+        "input_dimensions": input_dimensions,
+        "dimensions": dimensions,
+    }
+
+def reduce_embedding_dimensions(embedding: List[float], dimensions: int) -> List[float]:
+    """Project an embedding down to `dimensions` components with a fixed random projection"""
+    if dimensions >= len(embedding):
+        return list(embedding)
+    rows, scale = _get_projection(len(embedding), dimensions)
+    return [scale * (sum(positive(embedding)) - sum(negative(embedding))) for positive, negative in rows]
+
+def _shortest_float16(value: float) -> float:
+    """Shortest decimal that still rounds to the same half-precision value.
+
+    A half-precision value converted back to a Python float prints with ~17
+    significant digits in JSON; at most 5 are needed to identify it.
+    """
+    half = struct.pack("<e", value)
+    for digits in range(1, 6):
+        candidate = float(f"{value:.{digits}g}")
+        if struct.pack("<e", candidate) == half:
+            return candidate
+    return struct.unpack("<e", half)[0]
+
+def quantize_embedding(embedding: List[float], precision: str) -> Tuple[List[Union[int, float]], Optional[float]]:
+    """Quantize an embedding, returning (values, scale).
+
+    int8 uses symmetric per-vector scaling so that value * scale approximates the
+    original component; float16 rounds each component to half precision (written
+    with as few digits as round-trip) and has no scale. float32 returns the
+    embedding unchanged.
+    """
+    if precision == "int8":
+        max_abs = max((abs(x) for x in embedding), default=0.0)
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        return [max(-127, min(127, round(x / scale))) for x in embedding], scale
+    if precision == "float16":
+        halves = struct.unpack(f"<{len(embedding)}e", struct.pack(f"<{len(embedding)}e", *embedding))
+        return [_shortest_float16(x) for x in halves], None
+    return list(embedding), None
+
+def _json_size(values: List[Union[int, float]], scale: Optional[float] = None) -> int:
+    """Bytes an embedding (and its scale) takes in the JSON response"""
+    size = len(json.dumps(values, separators=(",", ":")))
+    if scale is not None:
+        size += len(json.dumps(scale))
+    return size
+
+def dequantize_embedding(values: List[float], scale: Optional[float]) -> List[float]:
+    """Reverse quantize_embedding (scale is None for float16/float32)"""
+    if scale is None:
+        return [float(x) for x in values]
+    return [x * scale for x in values]
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm > 0 else list(vector)
+
+def _top_k_neighbours(vectors: List[List[float]], top_k: int) -> List[set]:
+    """Return, for every vector, the indices of its top_k most cosine-similar other vectors"""
+    normalized = [_normalize(v) for v in vectors]
+    neighbours = []
+    for i, query in enumerate(normalized):
+        scores = [
+            (sum(a * b for a, b in zip(query, candidate)), j)
+            for j, candidate in enumerate(normalized) if j != i
+        ]
+        scores.sort(reverse=True)
+        neighbours.append({j for _, j in scores[:top_k]})
+    return neighbours
+
+def evaluate_quantization_recall(
+    embeddings: List[List[float]],
+    precision: str,
+    dimensions: Optional[int] = None,
+    top_k: int = QUANTIZATION_EVAL_TOP_K,
+    sample_size: int = QUANTIZATION_EVAL_SAMPLE_SIZE,
+    reduced_embeddings: Optional[List[List[float]]] = None,
+) -> Dict[str, Any]:
+    """Measure how much nearest-neighbour recall a quantization setting loses.
+
+    Takes a sample of full-precision embeddings, finds each one's top_k neighbours
+    by cosine similarity within the sample, repeats the search on the reduced and
+    quantized versions and reports the average overlap (recall@k).
+    Pass reduced_embeddings (aligned with embeddings) to reuse an existing projection.
+    """
+    if not embeddings:
+        raise ValueError("At least one embedding is required to evaluate quantization")
+
+    indices = list(range(len(embeddings)))
+    if len(embeddings) > sample_size:
+        indices = random.Random(EMBEDDING_PROJECTION_SEED).sample(indices, sample_size)
+    sample = [embeddings[i] for i in indices]
+
+    original_dimensions = len(sample[0])
+    target_dimensions = min(dimensions or original_dimensions, original_dimensions)
+    top_k = min(top_k, len(sample) - 1)
+
+    compressed = []
+    bytes_full = 0
+    bytes_quantized = 0
+    for i, embedding in zip(indices, sample):
+        if reduced_embeddings is not None:
+            reduced = reduced_embeddings[i]
+        else:
+            reduced = reduce_embedding_dimensions(embedding, target_dimensions)
+        values, scale = quantize_embedding(reduced, precision)
+        compressed.append(dequantize_embedding(values, scale))
+        # Sizes are measured on the JSON actually returned by /chunk-text
+        bytes_full += _json_size(embedding)
+        bytes_quantized += _json_size(values, scale)
+    bytes_full //= len(sample)
+    bytes_quantized //= len(sample)
+
+    recall = 1.0
+    if top_k > 0:
+        expected = _top_k_neighbours(sample, top_k)
+        actual = _top_k_neighbours(compressed, top_k)
+        recall = sum(len(e & a) for e, a in zip(expected, actual)) / (top_k * len(sample))
+
+    return {
+        "precision": precision,
+        "original_dimensions": original_dimensions,
+        "dimensions": target_dimensions,
+        "sample_size": len(sample),
+        "top_k": top_k,
+        "recall_at_k": round(recall, 4),
+        "recall_loss": round(1.0 - recall, 4),
+        "bytes_per_vector_full": bytes_full,
+        "bytes_per_vector_quantized": bytes_quantized,
+        "compression_ratio": round(bytes_full / bytes_quantized, 2),
+    }
+
+def reduce_chunk_embeddings(chunks: List[Dict[str, Any]], dimensions: int) -> List[List[float]]:
+    """Project every chunk's embedding down to `dimensions` components"""
+    return [reduce_embedding_dimensions(chunk["embedding"], dimensions) for chunk in chunks]
+
+def apply_embedding_quantization(
+    chunks: List[Dict[str, Any]],
+    precision: str,
+    dimensions: Optional[int] = None,
+    reduced_embeddings: Optional[List[List[float]]] = None,
+) -> List[Dict[str, Any]]:
+    """Reduce and quantize the embeddings of already-embedded chunks
+
+    Pass reduced_embeddings (aligned with chunks) to reuse an existing projection.
+    The projection used is recorded in each chunk's metadata.
+    """
+    try:
+        print(f"🗜️  [QUANTIZATION] Quantizing {len(chunks)} embeddings to {precision}" + (f", {dimensions} dimensions" if dimensions else ""))
+        if dimensions and reduced_embeddings is None:
+            reduced_embeddings = reduce_chunk_embeddings(chunks, dimensions)
+        quantized_chunks = []
+        for i, chunk in enumerate(chunks):
+            embedding = reduced_embeddings[i] if dimensions else chunk["embedding"]
+            values, scale = quantize_embedding(embedding, precision)
+            metadata = chunk["metadata"]
+            if dimensions:
+                metadata = {**metadata, "embedding_projection": projection_info(len(chunk["embedding"]), dimensions)}
+            quantized_chunks.append({
+                **chunk,
+                "metadata": metadata,
+                "embedding": values,
+                "embedding_precision": precision,
+                "embedding_scale": scale,
+            })
+        return quantized_chunks
+
+    except Exception as e:
+        print(f"💥 [QUANTIZATION] Error quantizing embeddings: {e}")
+        logger.error(f"Error quantizing embeddings: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to quantize embeddings: {str(e)}")
+
 @app.post("/extract-text", response_model=TextExtractionResponse)
 async def extract_text_endpoint(file: UploadFile = File(...)):
     """Extract text from uploaded PDF file"""
@@ -411,8 +701,18 @@ async def extract_for_cag_endpoint(file: UploadFile = File(...)):
 
 # RESTORED ORIGINAL CHUNKING ENDPOINT (for backward compatibility)
 @app.post("/chunk-text", response_model=ChunkingResponse)
-async def chunk_text_endpoint(file: UploadFile = File(...)):
-    """Extract text from PDF and create chunks using LlamaIndex"""
+async def chunk_text_endpoint(
+    file: UploadFile = File(...),
+    embedding_precision: str = Form("float32"),
+    embedding_dimensions: Optional[int] = Form(None),
+    evaluate_quantization: bool = Form(False),
+):
+    """Extract text from PDF and create chunks using LlamaIndex
+
+    Optionally returns int8/float16 quantized embeddings (embedding_precision),
+    reduced to embedding_dimensions with a random projection. Set
+    evaluate_quantization to include a recall@k report against full precision.
+    """
     try:
         print(f"📁 [CHUNK API] Received file: {file.filename}")
         print(f"📁 [CHUNK API] File size: {file.size} bytes")
@@ -422,6 +722,14 @@ async def chunk_text_endpoint(file: UploadFile = File(...)):
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
+        # Validate quantization options
+        if embedding_precision not in EMBEDDING_PRECISIONS:
+            raise HTTPException(status_code=400, detail=f"embedding_precision must be one of: {', '.join(EMBEDDING_PRECISIONS)}")
+        if embedding_dimensions is not None and embedding_dimensions not in EMBEDDING_DIMENSION_OPTIONS:
+            raise HTTPException(status_code=400, detail=f"embedding_dimensions must be one of: {', '.join(map(str, EMBEDDING_DIMENSION_OPTIONS))}")
+        if evaluate_quantization and embedding_precision == "float32" and not embedding_dimensions:
+            raise HTTPException(status_code=400, detail="evaluate_quantization requires a quantized embedding_precision or embedding_dimensions")
+        
         # Read file content
         file_content = await file.read()
         
@@ -436,7 +744,35 @@ async def chunk_text_endpoint(file: UploadFile = File(...)):
         
         # Step 3: Generate embeddings
         print("🤖 [CHUNK API] Step 3: Generating embeddings...")
-        chunks_with_embeddings = await generate_embeddings_for_chunks(chunks)
+        chunks_with_embeddings, dropped_chunks = await generate_embeddings_for_chunks(chunks)
+        if chunks and not chunks_with_embeddings:
+            raise HTTPException(status_code=502, detail=f"Failed to generate embeddings for all {len(chunks)} chunks: {dropped_chunks[0]['error']}")
+        
+        # Step 4 (optional): Quantize embeddings
+        quantization_report = None
+        if embedding_precision != "float32" or embedding_dimensions:
+            # CPU-bound pure-Python work - keep it off the event loop, and project
+            # each embedding only once for both the report and the response
+            reduced_embeddings = None
+            if embedding_dimensions:
+                reduced_embeddings = await run_in_threadpool(reduce_chunk_embeddings, chunks_with_embeddings, embedding_dimensions)
+            if evaluate_quantization and chunks_with_embeddings:
+                print("📏 [CHUNK API] Evaluating quantization recall against full precision...")
+                quantization_report = QuantizationReport(**await run_in_threadpool(
+                    evaluate_quantization_recall,
+                    [chunk["embedding"] for chunk in chunks_with_embeddings],
+                    embedding_precision,
+                    embedding_dimensions,
+                    reduced_embeddings=reduced_embeddings,
+                ))
+                print(f"📏 [CHUNK API] recall@{quantization_report.top_k}: {quantization_report.recall_at_k}, compression: {quantization_report.compression_ratio}x")
+            chunks_with_embeddings = await run_in_threadpool(
+                apply_embedding_quantization,
+                chunks_with_embeddings,
+                embedding_precision,
+                embedding_dimensions,
+                reduced_embeddings=reduced_embeddings,
+            )
         
         # Calculate average chunk size
         avg_chunk_size = sum(len(chunk["text"]) for chunk in chunks_with_embeddings) / len(chunks_with_embeddings) if chunks_with_embeddings else 0
@@ -444,13 +780,28 @@ async def chunk_text_endpoint(file: UploadFile = File(...)):
         print(f"✅ [CHUNK API] Processing completed successfully")
         print(f"📊 [CHUNK API] Results: {len(chunks_with_embeddings)} chunks with embeddings, avg size: {avg_chunk_size:.0f} chars")
         
+        message = "Text extracted, chunked, and embeddings generated successfully"
+        if dropped_chunks:
+            message += f" ({len(dropped_chunks)} of {len(chunks)} chunks dropped after embedding failures)"
+        
         return ChunkingResponse(
             success=True,
-            message="Text extracted, chunked, and embeddings generated successfully",
-            chunks=[ChunkResponse(text=chunk["text"], metadata=chunk["metadata"], embedding=chunk["embedding"]) for chunk in chunks_with_embeddings],
+            message=message,
+            chunks=[
+                ChunkResponse(
+                    text=chunk["text"],
+                    metadata=chunk["metadata"],
+                    embedding=chunk["embedding"],
+                    embedding_precision=chunk.get("embedding_precision"),
+                    embedding_scale=chunk.get("embedding_scale"),
+                )
+                for chunk in chunks_with_embeddings
+            ],
             filename=file.filename,
             total_chunks=len(chunks_with_embeddings),
-            avg_chunk_size=int(avg_chunk_size)
+            avg_chunk_size=int(avg_chunk_size),
+            quantization_report=quantization_report,
+            dropped_chunks=[DroppedChunk(**dropped) for dropped in dropped_chunks]
         )
         
     except HTTPException:
@@ -460,6 +811,108 @@ async def chunk_text_endpoint(file: UploadFile = File(...)):
         logger.error(f"Unexpected error in chunk_text_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/project-embedding", response_model=ProjectEmbeddingResponse)
+async def project_embedding_endpoint(request: ProjectEmbeddingRequest):
+    """Put a query embedding through the same projection used by /chunk-text
+
+    Chunks stored with embedding_dimensions can only be searched with query
+    vectors reduced by the identical projection (see metadata.embedding_projection).
+    """
+    if request.dimensions not in EMBEDDING_DIMENSION_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"dimensions must be one of: {', '.join(map(str, EMBEDDING_DIMENSION_OPTIONS))}")
+    if request.embedding_precision not in EMBEDDING_PRECISIONS:
+        raise HTTPException(status_code=400, detail=f"embedding_precision must be one of: {', '.join(EMBEDDING_PRECISIONS)}")
+    if len(request.embedding) <= request.dimensions:
+        raise HTTPException(status_code=400, detail=f"embedding must have more than {request.dimensions} dimensions")
+    
+    reduced = await run_in_threadpool(reduce_embedding_dimensions, request.embedding, request.dimensions)
+    values, scale = quantize_embedding(reduced, request.embedding_precision)
+    return ProjectEmbeddingResponse(
+        embedding=values,
+        embedding_precision=request.embedding_precision,
+        embedding_scale=scale,
+        projection=projection_info(len(request.embedding), request.dimensions)
+    )
+
+# ADMIN PROFILING - download cProfile + tracemalloc artifacts for a request
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Only allow callers presenting ADMIN_PROFILING_TOKEN"""
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def profile_artifact_response(profile: RequestProfile) -> Response:
+    return Response(
+        content=profile.artifact,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile.profile_id}.zip"',
+            "X-Profile-Id": profile.profile_id,
+        }
+    )
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_upload_endpoint(
+    file: UploadFile = File(...),
+    endpoint: str = Form("chunk-text"),
+    mode: str = Form("both"),
+    embedding_precision: str = Form("float32"),
+    embedding_dimensions: Optional[int] = Form(None),
+    evaluate_quantization: bool = Form(False),
+):
+    """Run an uploaded PDF through one of the processing endpoints under the profiler
+
+    Returns a zip with cProfile stats (mode "cpu"), tracemalloc peak-memory stats
+    (mode "memory") or both. The quantization fields are forwarded to /chunk-text.
+    cProfile only records the event-loop thread, so work run in the threadpool
+    (quantization, recall evaluation) does not show up in the CPU profile.
+    """
+    handlers = {
+        "extract-text": lambda: extract_text_endpoint(file=file),
+        "extract-for-cag": lambda: extract_for_cag_endpoint(file=file),
+        "chunk-text": lambda: chunk_text_endpoint(
+            file=file,
+            embedding_precision=embedding_precision,
+            embedding_dimensions=embedding_dimensions,
+            evaluate_quantization=evaluate_quantization,
+        ),
+    }
+    if endpoint not in handlers:
+        raise HTTPException(status_code=400, detail=f"endpoint must be one of: {', '.join(handlers)}")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(PROFILE_MODES)}")
+    
+    print(f"🔬 [PROFILE API] Profiling /{endpoint} ({mode}) for file: {file.filename}")
+    profile = RequestProfile(f"POST /{endpoint} ({file.filename})", mode)
+    try:
+        with profile:
+            await handlers[endpoint]()
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException as e:
+        # The failure is recorded in the profile summary - still return the artifact
+        print(f"⚠️  [PROFILE API] /{endpoint} failed while profiling: {e.detail}")
+    
+    profile_store.add(profile)
+    peak_memory = profile.summary["peak_memory_bytes"]
+    memory_note = f", peak memory {peak_memory} bytes" if peak_memory is not None else ""
+    print(f"✅ [PROFILE API] Profile {profile.profile_id}: {profile.summary['wall_time_seconds']}s{memory_note}")
+    return profile_artifact_response(profile)
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles_endpoint():
+    """List the summaries of recently captured profiles, newest first"""
+    return {"profiles": profile_store.list()}
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile_endpoint(profile_id: str):
+    """Download a profile captured with the X-Profile-Request header"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile_artifact_response(profile)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
@@ -0,0 +1,251 @@
+"""
+On-demand request profiling for the PDF service.
+
+A profile captures cProfile call stats and/or tracemalloc peak memory for one
+request and packages them as a zip artifact:
+- profile.prof  raw pstats dump (open with snakeviz or pstats)   [cpu]
+- profile.txt   top functions by cumulative time                 [cpu]
+- memory.txt    peak/current traced memory and top allocations   [memory]
+- summary.json  the headline numbers
+
+Profiling is admin-only and the middleware is only installed when
+ADMIN_PROFILING_TOKEN is set, so normal requests pay nothing for it.
+
+cProfile and tracemalloc are process-wide, so only one profile runs at a time
+and work from other requests interleaved on the event loop can show up in it.
+cProfile only sees the event-loop thread, so work handed to the threadpool
+(e.g. embedding quantization) is missing from the CPU profile. While a
+profile runs, tracemalloc slows allocation-heavy code (such as JSON decoding)
+in every request; use mode "cpu" for timings and "memory" for peak memory when
+the combined "both" mode distorts the numbers.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+import zipfile
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ADMIN_PROFILING_TOKEN = os.getenv("ADMIN_PROFILING_TOKEN")
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "20"))
+PROFILE_TOP_FUNCTIONS = 50
+PROFILE_TOP_ALLOCATIONS = 25
+# More frames give deeper allocation tracebacks but multiply tracing overhead
+TRACEMALLOC_FRAMES = 1
+
+PROFILE_MODES = ("both", "cpu", "memory")
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+PROFILE_FLAG_HEADER = "x-profile-request"
+PROFILE_ID_HEADER = "x-profile-id"
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def profiling_enabled() -> bool:
+    return bool(ADMIN_PROFILING_TOKEN)
+
+
+def is_admin_token(token: Optional[Union[str, bytes]]) -> bool:
+    """Constant-time check of an admin token against ADMIN_PROFILING_TOKEN.
+
+    Compares bytes, so raw header values that aren't valid UTF-8 are simply
+    rejected.
+    """
+    if not ADMIN_PROFILING_TOKEN or not token:
+        return False
+    if isinstance(token, str):
+        token = token.encode("utf-8", errors="surrogateescape")
+    return hmac.compare_digest(token, ADMIN_PROFILING_TOKEN.encode())
+
+
+class RequestProfile:
+    """Context manager that profiles CPU time and/or memory of the enclosed block"""
+
+    def __init__(self, label: str, mode: str = "both"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(PROFILE_MODES)}")
+        self.label = label
+        self.mode = mode
+        self.profile_id = uuid.uuid4().hex
+        self.artifact: Optional[bytes] = None
+        self.summary: Dict[str, Any] = {}
+        self._profiler = cProfile.Profile() if mode in ("both", "cpu") else None
+        self._trace_memory = mode in ("both", "memory")
+        self._started_tracemalloc = False
+        self._snapshot_before: Optional[tracemalloc.Snapshot] = None
+        self._started_at = 0.0
+
+    def __enter__(self) -> "RequestProfile":
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another request is already being profiled")
+        try:
+            if self._trace_memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self._started_tracemalloc = True
+                self._snapshot_before = tracemalloc.take_snapshot()
+                tracemalloc.reset_peak()
+            self._started_at = time.perf_counter()
+            if self._profiler is not None:
+                self._profiler.enable()
+        except Exception:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            _profile_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if self._profiler is not None:
+                self._profiler.disable()
+            wall_time = time.perf_counter() - self._started_at
+            current = peak = None
+            snapshot_after = None
+            if self._trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot_after = tracemalloc.take_snapshot()
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+            self.summary = {
+                "profile_id": self.profile_id,
+                "label": self.label,
+                "mode": self.mode,
+                "wall_time_seconds": round(wall_time, 4),
+                "peak_memory_bytes": peak,
+                "current_memory_bytes": current,
+                "error": f"{exc_type.__name__}: {exc}" if exc_type else None,
+            }
+            self.artifact = self._build_artifact(snapshot_after, current, peak)
+            memory_note = f", peak memory {peak / 1024 / 1024:.1f} MiB" if peak is not None else ""
+            logger.info(f"Profiled {self.label} ({self.mode}): {wall_time:.3f}s{memory_note}")
+        finally:
+            _profile_lock.release()
+
+    def _build_artifact(self, snapshot_after: Optional[tracemalloc.Snapshot], current: Optional[int], peak: Optional[int]) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            if self._profiler is not None:
+                stats_text = io.StringIO()
+                stats = pstats.Stats(self._profiler, stream=stats_text)
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+                archive.writestr("profile.prof", _dump_pstats(self._profiler))
+                archive.writestr("profile.txt", stats_text.getvalue())
+
+            if snapshot_after is not None:
+                memory_lines = [
+                    f"Peak traced memory:    {peak / 1024 / 1024:.2f} MiB",
+                    f"Current traced memory: {current / 1024 / 1024:.2f} MiB",
+                    "",
+                    f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites retained since the request started:",
+                ]
+                for stat in snapshot_after.compare_to(self._snapshot_before, "lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                    memory_lines.append(str(stat))
+                archive.writestr("memory.txt", "\n".join(memory_lines) + "\n")
+
+            archive.writestr("summary.json", json.dumps(self.summary, indent=2))
+        return buffer.getvalue()
+
+
+def _dump_pstats(profiler: cProfile.Profile) -> bytes:
+    """Serialize profiler stats in the binary format pstats.Stats can load"""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+class ProfileStore:
+    """Keeps the most recent profile artifacts in memory for download"""
+
+    def __init__(self, max_size: int = PROFILE_STORE_SIZE):
+        self.max_size = max_size
+        self._profiles: "OrderedDict[str, RequestProfile]" = OrderedDict()
+
+    def add(self, profile: RequestProfile) -> None:
+        self._profiles[profile.profile_id] = profile
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return self._profiles.get(profile_id)
+
+    def list(self):
+        return [profile.summary for profile in reversed(self._profiles.values())]
+
+
+profile_store = ProfileStore()
+
+
+def parse_profile_mode(value: bytes) -> str:
+    """Map an X-Profile-Request header value to a profile mode ("1"/"true" mean both)"""
+    mode = value.decode("latin-1").strip().lower()
+    return mode if mode in PROFILE_MODES else "both"
+
+
+class ProfilingMiddleware:
+    """Profiles requests sent with an admin token and the X-Profile-Request header.
+
+    The header value picks the mode: "cpu", "memory" or "both" (any other value,
+    e.g. "1"). The response is returned unchanged apart from an X-Profile-Id
+    header; the artifact can then be downloaded from /admin/profiles/{profile_id}.
+    /admin/ paths are never profiled here - /admin/profile takes its own profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        profile_flag = headers.get(PROFILE_FLAG_HEADER.encode())
+        if not profile_flag:
+            await self.app(scope, receive, send)
+            return
+        if not is_admin_token(headers.get(ADMIN_TOKEN_HEADER.encode())):
+            logger.warning(f"Ignoring profile request without a valid admin token for {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            profile = RequestProfile(f"{scope['method']} {scope['path']}", parse_profile_mode(profile_flag))
+            profile.__enter__()
+        except Exception as e:
+            logger.warning(f"Could not profile {scope['path']} ({e}), serving it unprofiled")
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.encode(), profile.profile_id.encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        except BaseException as e:
+            profile.__exit__(type(e), e, e.__traceback__)
+            profile_store.add(profile)
+            raise
+        profile.__exit__(None, None, None)
+        profile_store.add(profile)
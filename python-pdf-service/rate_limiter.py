@@ -0,0 +1,312 @@
+"""
+Process-wide, rate-limit-aware scheduler for OpenAI calls.
+
+Every /chunk-text request shares one scheduler, which:
+- tracks requests-per-minute and tokens-per-minute with token buckets
+- syncs those buckets with OpenAI's x-ratelimit-* response headers
+- pauses all dispatch when a 429 tells us to back off
+- hands out capacity round-robin across in-flight documents, so one large
+  PDF cannot starve the others
+- retries transient failures with jittered exponential backoff
+"""
+
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Defaults match the text-embedding-ada-002 tier 1 limits
+DEFAULT_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "3000"))
+DEFAULT_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "1000000"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+# Upper bound on a shared pause derived from x-ratelimit-reset-* headers
+RATE_LIMIT_PAUSE_MAX_SECONDS = 10.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for TPM accounting"""
+    return len(text) // 4 + 1
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "1s", "6m0s" or "20ms" into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """How long a rate-limited response asks us to wait, if it says"""
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    # Without an explicit retry-after, only wait for the request limit to reset
+    # when that is the limit we hit. x-ratelimit-reset-tokens is the time until
+    # the whole TPM budget refills - the token bucket (synced to the remaining
+    # tokens) already paces calls as capacity comes back.
+    if _header_number(headers, "x-ratelimit-remaining-requests") == 0:
+        reset_requests = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+        if reset_requests is not None:
+            return min(reset_requests, RATE_LIMIT_PAUSE_MAX_SECONDS)
+    return None
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units per minute"""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self._updated = time.monotonic()
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.refill_rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """Align the bucket with the limit/remaining values reported by the server"""
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class EmbeddingScheduler:
+    """Shares OpenAI rate-limit capacity fairly across concurrent documents"""
+
+    def __init__(
+        self,
+        rpm_limit: int = DEFAULT_RPM_LIMIT,
+        tpm_limit: int = DEFAULT_TPM_LIMIT,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.requests = TokenBucket(rpm_limit)
+        self.tokens = TokenBucket(tpm_limit)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.paused_until = 0.0
+        # document_id -> waiting (future, token_cost) pairs, served round-robin
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._changed: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _notify(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+
+    def _ensure_dispatcher(self) -> None:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def _next_waiter(self) -> Optional[Tuple[str, asyncio.Future, int]]:
+        """Head of the next document's queue in round-robin order, skipping cancelled waiters"""
+        while self._queues:
+            document_id, queue = next(iter(self._queues.items()))
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[document_id]
+                continue
+            future, token_cost = queue[0]
+            return document_id, future, token_cost
+        return None
+
+    def _wait_time(self, token_cost: int) -> Optional[float]:
+        """Seconds to wait before the next grant, or None to wait for a slot release"""
+        if self.in_flight >= self.max_concurrency:
+            return None
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.time_until(1),
+            self.tokens.time_until(token_cost),
+            0.0,
+        )
+
+    async def _dispatch(self) -> None:
+        while True:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            document_id, future, token_cost = waiter
+
+            delay = self._wait_time(token_cost)
+            if delay is None or delay > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queue = self._queues[document_id]
+            queue.popleft()
+            # Rotate so the next grant goes to a different document
+            if queue:
+                self._queues.move_to_end(document_id)
+            else:
+                del self._queues[document_id]
+
+            self.requests.consume(1)
+            self.tokens.consume(token_cost)
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def acquire(self, document_id: str, token_cost: int) -> None:
+        """Wait for a turn to send one request costing `token_cost` tokens"""
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(document_id, deque()).append((future, token_cost))
+        self._notify()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # A grant may have raced the cancellation - give the slot back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._notify()
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Sync the buckets with the x-ratelimit-* headers of a response"""
+        if not headers:
+            return
+        self.requests.sync(
+            _header_number(headers, "x-ratelimit-limit-requests"),
+            _header_number(headers, "x-ratelimit-remaining-requests"),
+        )
+        self.tokens.sync(
+            _header_number(headers, "x-ratelimit-limit-tokens"),
+            _header_number(headers, "x-ratelimit-remaining-tokens"),
+        )
+
+    def pause(self, seconds: float) -> None:
+        """Stop granting capacity to anyone for `seconds` (after a 429)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self._notify()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (0-based) retry attempt"""
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+    async def create_embedding(
+        self,
+        client: "openai.AsyncOpenAI",
+        text: str,
+        document_id: str,
+        model: str = "text-embedding-ada-002",
+    ) -> List[float]:
+        """Create one embedding through the scheduler, retrying transient failures"""
+        token_cost = estimate_tokens(text)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(document_id, token_cost)
+            try:
+                raw_response = await client.embeddings.with_raw_response.create(model=model, input=text)
+                self.update_from_headers(raw_response.headers)
+                return raw_response.parse().data[0].embedding
+            except RETRYABLE_ERRORS as e:
+                response = getattr(e, "response", None)
+                headers = response.headers if response is not None else None
+                self.update_from_headers(headers)
+                if attempt >= self.max_retries:
+                    raise
+
+                delay = self.backoff_delay(attempt)
+                if isinstance(e, openai.RateLimitError):
+                    server_delay = retry_after_seconds(headers)
+                    if server_delay is not None:
+                        delay = max(delay, server_delay)
+                        # Everyone shares the same limit, so everyone backs off
+                        self.pause(server_delay)
+                logger.warning(
+                    f"OpenAI call for {document_id} failed ({type(e).__name__}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+                )
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "documents_waiting": len(self._queues),
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level, 1),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
+
+
+# Shared by every request handled by this process
+embedding_scheduler = EmbeddingScheduler()